@@ -6,36 +6,104 @@ Arduino → Raspberry Pi → MQTT
 
 import asyncio
 import logging
+import random
+import time
+import uuid
 from bleak import BleakScanner, BleakClient
 import paho.mqtt.client as mqtt
 
+# Skip per-record frame/thread/process introspection in logging -
+# none of it appears in our log format and it costs CPU per record
+logging.logThreads = False
+logging.logProcesses = False
+logging.logMultiprocessing = False
+logging._srcfile = None
+
 
 # === Configuration ===
 ARDUINO_NAME = "Arduino_Laser_Receiver"
+SERVICE_UUID = "12345678-1234-1234-1234-123456789abc"
 SENSOR_UUID = "87654321-4321-4321-4321-cba987654321"
 COMMAND_UUID = "11111111-2222-3333-4444-555555555555"
 
+# Pre-parsed/encoded forms so the hot paths skip per-call conversion
+SENSOR_UUID_OBJ = uuid.UUID(SENSOR_UUID)
+COMMAND_UUID_OBJ = uuid.UUID(COMMAND_UUID)
+
 MQTT_BROKER = "iot.qut.edu.kg"
 MQTT_PORT = 1883
 SENSOR_TOPIC = "iot/sensors/laser_data"
 COMMAND_TOPIC = "iot/commands/laser"
+MQTT_RECONNECT_MIN_DELAY = 1    # seconds
+MQTT_RECONNECT_MAX_DELAY = 120  # seconds
 
 ENABLE_MQTT = True  # Set to False to disable MQTT
 
+SCAN_TIMEOUT = 10.0   # BLE scan window (seconds)
+RETRY_DELAY = 3       # Base delay between BLE retries (seconds)
+MAX_RETRY_DELAY = 300  # Cap for exponential backoff (seconds)
+
+BLE_FAILURE_THRESHOLD = 5  # Failed writes before the circuit opens
+BLE_CIRCUIT_OPEN_TIME = 30  # Seconds to drop commands after tripping
+
+RX_QUEUE_SIZE = 64       # Pending sensor samples awaiting publish
+COALESCE_WINDOW = 0.02   # Merge samples arriving within this window (s)
+
+
+class _CachedTimeFormatter(logging.Formatter):
+    """Formatter that renders the timestamp at most once per second
+
+    The default asctime path calls localtime + strftime per record,
+    which dominates logging cost at high packet rates. Our format only
+    has second resolution, so reuse the rendered string until the
+    second rolls over.
+    """
+
+    def __init__(self, fmt):
+        super().__init__(fmt)
+        self._cached_second = None
+        self._cached_time = ""
+
+    def formatTime(self, record, datefmt=None):
+        second = int(record.created)
+        if second != self._cached_second:
+            self._cached_second = second
+            self._cached_time = time.strftime(
+                '%Y-%m-%d %H:%M:%S', time.localtime(second)
+            )
+        return self._cached_time
+
 
 class LaserBridge:
     """Laser Sensor BLE-MQTT Bridge"""
 
+    __slots__ = (
+        'ble_client', 'mqtt_client', 'running', 'log',
+        '_loop', '_schedule', '_stop_event', '_retry_attempt',
+        '_ble_failures', '_circuit_open_until', '_rx_queue',
+        '_scanner', '_found_event', '_found_device', '_mqtt_task',
+    )
+
     def __init__(self):
         self.ble_client = None
         self.mqtt_client = None
         self.running = False
+        self._loop = None
+        self._schedule = None  # bound call_soon_threadsafe, set in run()
+        self._stop_event = asyncio.Event()
+        self._retry_attempt = 0
+        self._ble_failures = 0
+        self._circuit_open_until = 0.0
+        self._rx_queue = asyncio.Queue(maxsize=RX_QUEUE_SIZE)
+        self._scanner = None
+        self._found_event = asyncio.Event()
+        self._found_device = None
+        self._mqtt_task = None
 
         # Setup logging
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(message)s'
-        )
+        handler = logging.StreamHandler()
+        handler.setFormatter(_CachedTimeFormatter('%(asctime)s - %(message)s'))
+        logging.basicConfig(level=logging.INFO, handlers=[handler])
         self.log = logging.getLogger(__name__)
 
     def setup_mqtt(self):
@@ -45,93 +113,227 @@ class LaserBridge:
             return
 
         try:
-            self.log.info(f"Connecting to MQTT: {MQTT_BROKER}:{MQTT_PORT}")
+            self.log.info("Connecting to MQTT: %s:%s", MQTT_BROKER, MQTT_PORT)
 
             # Create client
             self.mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
             self.mqtt_client.on_connect = self.on_mqtt_connect
             self.mqtt_client.on_message = self.on_mqtt_message
+            self.mqtt_client.max_inflight_messages_set(1)
+
+            # Drive paho's socket from the asyncio loop instead of the
+            # loop_start() background thread
+            self.mqtt_client.on_socket_open = self._on_socket_open
+            self.mqtt_client.on_socket_close = self._on_socket_close
+            self.mqtt_client.on_socket_register_write = (
+                self._on_socket_register_write
+            )
+            self.mqtt_client.on_socket_unregister_write = (
+                self._on_socket_unregister_write
+            )
 
-            # Connect asynchronously
-            self.mqtt_client.loop_start()
             self.mqtt_client.connect_async(MQTT_BROKER, MQTT_PORT, 60)
+            self._mqtt_task = self._loop.create_task(self._mqtt_loop())
 
             self.log.info("✓ MQTT started")
 
         except Exception as e:
-            self.log.warning(f"MQTT connection failed: {e}")
+            self.log.warning("MQTT connection failed: %s", e)
             self.mqtt_client = None
 
+    # Socket callbacks may fire from the executor thread during
+    # reconnect, so route the add/remove through call_soon_threadsafe
+    def _on_socket_open(self, client, userdata, sock):
+        self._loop.call_soon_threadsafe(
+            self._loop.add_reader, sock, client.loop_read
+        )
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._loop.call_soon_threadsafe(self._loop.remove_reader, sock)
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._loop.call_soon_threadsafe(
+            self._loop.add_writer, sock, client.loop_write
+        )
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._loop.call_soon_threadsafe(self._loop.remove_writer, sock)
+
+    async def _mqtt_loop(self):
+        """Connect to the broker and service paho's housekeeping
+
+        Socket reads/writes are dispatched by add_reader/add_writer, so
+        only the blocking connect and the periodic loop_misc() (pings,
+        retransmits) are handled here, with exponential backoff on
+        broker outages.
+        """
+        delay = MQTT_RECONNECT_MIN_DELAY
+        while self.running:
+            try:
+                # reconnect() does blocking DNS/TCP setup
+                await self._loop.run_in_executor(
+                    None, self.mqtt_client.reconnect
+                )
+            except Exception as e:
+                self.log.warning("MQTT connect failed: %s", e)
+            else:
+                delay = MQTT_RECONNECT_MIN_DELAY
+                while (self.running and
+                       self.mqtt_client.loop_misc() == mqtt.MQTT_ERR_SUCCESS):
+                    await asyncio.sleep(1)
+
+            if not self.running:
+                break
+            self.log.info("MQTT reconnecting in %ds", delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MQTT_RECONNECT_MAX_DELAY)
+
     def on_mqtt_connect(self, client, userdata, flags, rc, properties=None):
         """MQTT connection callback"""
         if rc == 0:
             self.log.info("✓ MQTT connected")
             client.subscribe(COMMAND_TOPIC)
         else:
-            self.log.error(f"✗ MQTT connection failed: {rc}")
+            self.log.error("✗ MQTT connection failed: %s", rc)
 
     def on_mqtt_message(self, client, userdata, msg):
         """Received MQTT command"""
         command = msg.payload.decode('utf-8')
-        self.log.info(f"Received command: {command}")
+        self.log.info("Received command: %s", command)
 
-        # Forward to Arduino
-        if self.ble_client:
-            asyncio.create_task(self.send_command(command))
+        # Forward to Arduino; _schedule is safe from any thread
+        if self.ble_client and self._schedule:
+            self._schedule(asyncio.create_task, self.send_command(command))
 
     async def send_command(self, command):
         """Send command to Arduino"""
+        # Circuit breaker: after repeated write failures, drop commands
+        # for a while instead of banging on a dead BLE link
+        if time.monotonic() < self._circuit_open_until:
+            self.log.warning("Circuit open, dropping command: %s", command)
+            return
+
         try:
             await self.ble_client.write_gatt_char(
-                COMMAND_UUID,
+                COMMAND_UUID_OBJ,
                 command.encode('utf-8')
             )
-            self.log.info(f"✓ Command sent: {command}")
+            self._ble_failures = 0
+            self._circuit_open_until = 0.0
+            self.log.info("✓ Command sent: %s", command)
         except Exception as e:
-            self.log.error(f"Send failed: {e}")
+            self._ble_failures += 1
+            if self._ble_failures >= BLE_FAILURE_THRESHOLD:
+                self._circuit_open_until = (
+                    time.monotonic() + BLE_CIRCUIT_OPEN_TIME
+                )
+                self.log.warning(
+                    "BLE circuit opened for %ds after %d failures",
+                    BLE_CIRCUIT_OPEN_TIME, self._ble_failures
+                )
+            self.log.error("Send failed: %s", e)
+
+    async def _rx_worker(self):
+        """Decode and publish sensor samples, coalescing bursts"""
+        # Hoist the per-packet attribute lookups out of the loop
+        queue = self._rx_queue
+        get_nowait = queue.get_nowait
+        log = self.log
 
-    def on_sensor_data(self, sender, data):
-        """Received sensor data"""
-        try:
-            json_data = data.decode('utf-8')
-            self.log.info(f"📡 {json_data}")
+        while self.running:
+            data = await queue.get()
 
-            # Publish to MQTT
-            if self.mqtt_client:
-                self.mqtt_client.publish(SENSOR_TOPIC, json_data, qos=1)
-                self.log.info("✓ Published to MQTT")
+            # Let a burst settle, then keep only the latest sample
+            await asyncio.sleep(COALESCE_WINDOW)
+            while True:
+                try:
+                    data = get_nowait()
+                except asyncio.QueueEmpty:
+                    break
 
-        except Exception as e:
-            self.log.error(f"Data processing failed: {e}")
+            try:
+                # The payload is already UTF-8 JSON from the Arduino;
+                # publish the bytes as-is and only decode when the
+                # debug log would actually be emitted
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("📡 %s", data.decode('utf-8', 'replace'))
+
+                mqtt_client = self.mqtt_client
+                if mqtt_client:
+                    # QoS 0: only the latest reading matters, so skip
+                    # PUBACK round trips and paho's in-flight tracking
+                    mqtt_client.publish(SENSOR_TOPIC, data, qos=0)
+                    log.debug("✓ Published to MQTT")
+            except Exception as e:
+                log.error("Data processing failed: %s", e)
+
+    def _on_adv(self, device, adv):
+        """Scanner detection callback: match the advertised local name"""
+        if adv.local_name and adv.local_name.startswith(ARDUINO_NAME):
+            self._found_device = device
+            self._found_event.set()
 
     async def find_arduino(self):
-        """Scan for Arduino device"""
+        """Scan for Arduino device, returning as soon as it is seen"""
         self.log.info("Scanning for Arduino...")
 
-        devices = await BleakScanner.discover(timeout=10.0)
-        self.log.info(f"Found {len(devices)} BLE devices")
+        # One scanner for the whole process: re-registering BlueZ
+        # D-Bus signal handlers every scan cycle is costly on a Pi.
+        # It also filters by our service UUID at the OS level instead
+        # of post-filtering every advertiser in range.
+        if self._scanner is None:
+            self._scanner = BleakScanner(
+                detection_callback=self._on_adv, service_uuids=[SERVICE_UUID]
+            )
 
-        for device in devices:
-            if device.name and ARDUINO_NAME in device.name:
-                self.log.info(f"✓ Found: {device.name}")
-                return device
+        self._found_device = None
+        self._found_event.clear()
 
-        return None
+        await self._scanner.start()
+        try:
+            await asyncio.wait_for(
+                self._found_event.wait(), timeout=SCAN_TIMEOUT
+            )
+            self.log.info("✓ Found: %s", self._found_device.name)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            await self._scanner.stop()
+
+        return self._found_device
+
+    async def _backoff(self):
+        """Wait before the next BLE retry (exponential backoff + jitter)"""
+        delay = min(MAX_RETRY_DELAY, RETRY_DELAY * (2 ** self._retry_attempt))
+        delay += random.uniform(0, 1)
+        self._retry_attempt += 1
+        self.log.info("Retrying in %.1f seconds...", delay)
+        # Intentional wall-clock delay (not a cooperative yield)
+        await asyncio.sleep(delay)
 
     async def connect_arduino(self, device):
         """Connect to Arduino"""
+        self._retry_attempt = 0
         async with BleakClient(device.address) as client:
             self.ble_client = client
             self.log.info("✓ BLE connected")
 
-            # Subscribe to sensor data
-            await client.start_notify(SENSOR_UUID, self.on_sensor_data)
+            # Subscribe to sensor data. The handler binds the queue's
+            # put_nowait as a default arg so each notification costs a
+            # single local lookup instead of an attribute chain.
+            def on_sensor_data(sender, data, _put=self._rx_queue.put_nowait):
+                try:
+                    _put(bytes(data))
+                except asyncio.QueueFull:
+                    pass  # Stale sample, the worker is behind - drop it
+
+            await client.start_notify(SENSOR_UUID_OBJ, on_sensor_data)
             self.log.info("✓ Started receiving data")
             self.log.info("=" * 60)
 
-            # Keep connection alive
-            while self.running:
-                await asyncio.sleep(1)
+            # Keep connection alive until stop() fires the event
+            # (no periodic wakeups, unlike a sleep(1) poll loop)
+            await self._stop_event.wait()
 
     async def run(self):
         """Main loop"""
@@ -140,7 +342,16 @@ class LaserBridge:
         self.log.info("=" * 60)
 
         self.running = True
+        self._loop = asyncio.get_running_loop()
+        self._schedule = self._loop.call_soon_threadsafe
+
+        # Eager tasks (Python 3.12+) run until their first await without
+        # a scheduler round trip - short BLE writes often finish eagerly
+        if hasattr(asyncio, "eager_task_factory"):
+            self._loop.set_task_factory(asyncio.eager_task_factory)
+
         self.setup_mqtt()
+        rx_worker = asyncio.create_task(self._rx_worker())
 
         # Main loop: scan → connect → retry
         while self.running:
@@ -148,21 +359,25 @@ class LaserBridge:
                 device = await self.find_arduino()
 
                 if not device:
-                    self.log.warning("Arduino not found, retrying in 5 seconds...")
-                    await asyncio.sleep(5)
+                    self.log.warning("Arduino not found")
+                    await self._backoff()
                     continue
 
                 await self.connect_arduino(device)
 
             except Exception as e:
-                self.log.error(f"Connection failed: {e}")
-                await asyncio.sleep(3)
+                self.log.error("Connection failed: %s", e)
+                await self._backoff()
+
+        rx_worker.cancel()
 
     def stop(self):
         """Stop bridge"""
         self.running = False
+        if self._schedule:
+            # May be called from a signal handler / foreign thread
+            self._schedule(self._stop_event.set)
         if self.mqtt_client:
-            self.mqtt_client.loop_stop()
             self.mqtt_client.disconnect()
         self.log.info("Stopped")
 
@@ -178,4 +393,9 @@ async def main():
 
 
 if __name__ == "__main__":
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass  # uvloop not installed, use the default event loop
     asyncio.run(main())